@@ -13,6 +13,7 @@ import enum
 import os
 import pathlib
 import signal
+from contextlib import suppress
 from functools import wraps
 
 from typing import Annotated, Optional, cast
@@ -33,6 +34,30 @@ err_console = Console(stderr=True)
 DEBUG = os.environ.get("LVMCRYO_DEBUG", "").lower() not in ["", "0", "false"]
 
 
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Returns the running event loop or creates a new one.
+
+    If ``uvloop`` is installed it is used for the new event loop.
+
+    """
+
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+
+    loop_factory = asyncio.new_event_loop
+    with suppress(ImportError):
+        import uvloop
+
+        loop_factory = uvloop.new_event_loop
+
+    loop = loop_factory()
+    asyncio.set_event_loop(loop)
+
+    return loop
+
+
 def cli_coro(
     signals=(signal.SIGHUP, signal.SIGTERM, signal.SIGINT),
     shutdown_func=None,
@@ -42,7 +67,7 @@ def cli_coro(
     def decorator_cli_coro(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            loop = asyncio.get_event_loop()
+            loop = get_event_loop()
             if shutdown_func:
                 for ss in signals:
                     loop.add_signal_handler(ss, shutdown_func, ss, loop)
@@ -265,6 +265,12 @@ class Config(BaseModel):
         default=False,
         description="Whether to write JSON output.",
     )
+    db_log_data_max_size: int | None = Field(
+        default=1024**2,
+        description="Maximum size in bytes of the JSON log file to include in "
+        "the database record. Larger logs are only referenced by path. "
+        "If None, the log is always included.",
+    )
     write_data: bool = Field(
         default=False,
         description="Whether to write data output.",
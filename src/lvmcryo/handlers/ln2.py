@@ -15,6 +15,7 @@ from dataclasses import dataclass, field
 
 from typing import Any, Callable, Coroutine, Literal, NoReturn, overload
 
+import httpx
 import sshkeyboard
 from pydantic import BaseModel, field_serializer
 from rich import box
@@ -103,6 +104,9 @@ class LN2Handler:
         The API route to query system alerts.
     check_o2_sensors
         Whether to check O2 sensors during a fill/purge.
+    http_client
+        An HTTP client to reuse for the API requests. If not provided, a new
+        client is created for each request.
 
     """
 
@@ -114,6 +118,7 @@ class LN2Handler:
     dry_run: bool = False
     alerts_route: str | None = "http://lvm-hub.lco.cl:8090/api/alerts"
     check_o2_sensors: bool = True
+    http_client: httpx.AsyncClient | None = None
 
     monitor_alerts: bool = True
 
@@ -155,6 +160,9 @@ class LN2Handler:
         self.aborted: bool = False
         self.error: str | None = None
 
+        # Set after all the valves have been closed by a call to stop().
+        self.valves_closed: bool = False
+
     def get_specs(self):
         """Returns a list of spectrographs being handled."""
 
@@ -206,7 +214,7 @@ class LN2Handler:
             try:
                 if check_o2_sensors:
                     self.log.info("Checking for O2 alarms ...")
-                    if await o2_alert(self.alerts_route):
+                    if await o2_alert(self.alerts_route, client=self.http_client):
                         self.fail("O2 alarm detected.")
                     else:
                         self.log.debug("No O2 alarms reported.")
@@ -353,6 +361,7 @@ class LN2Handler:
                 else:
                     preopen_cb()
 
+            self.valves_closed = False
             await valve_handler.start_fill(
                 min_open_time=min_purge_time or 0.0,
                 max_open_time=max_purge_time,
@@ -457,6 +466,7 @@ class LN2Handler:
                 else:
                     preopen_cb()
 
+            self.valves_closed = False
             await asyncio.gather(*fill_tasks)
 
             if not self.aborted:
@@ -580,7 +590,10 @@ class LN2Handler:
 
         while True:
             try:
-                if self.check_o2_sensors and await o2_alert(self.alerts_route):
+                if self.check_o2_sensors and await o2_alert(
+                    self.alerts_route,
+                    client=self.http_client,
+                ):
                     await self.abort(
                         error="O2 alarm detected: closing valves and aborting.",
                         close_valves=True,
@@ -622,10 +635,14 @@ class LN2Handler:
         """Cancels ongoing fills and closes the valves.
 
         If ``only_active=True`` only active valves will be closed. Otherwise
-        closes all valves.
+        closes all valves. Once all the valves have been closed, subsequent calls
+        that would close all the valves again are skipped.
 
         """
 
+        if self.valves_closed and close_valves:
+            return
+
         tasks: list[Coroutine] = []
 
         for valve_handler in self.valve_handlers.values():
@@ -639,6 +656,9 @@ class LN2Handler:
             if isinstance(result, Exception):
                 raise result
 
+        if close_valves and not only_active:
+            self.valves_closed = True
+
     async def clear(self):
         """Cleanly finishes tasks and other clean-up tasks."""
 
@@ -37,9 +37,21 @@ __all__ = [
     "cancel_nps_threads",
     "close_all_valves",
     "outlet_info",
+    "clear_outlet_id_cache",
 ]
 
 
+# Mapping of (actor, outlet name) to the outlet numeric id. Populated by
+# outlet_info(). The ids do not change unless the NPS is reconfigured.
+_OUTLET_IDS: dict[tuple[str, str], int] = {}
+
+
+def clear_outlet_id_cache():
+    """Clears the cached outlet ids, for example if the NPS was reconfigured."""
+
+    _OUTLET_IDS.clear()
+
+
 @Retrier(max_attempts=3, delay=1, timeout=10)
 async def outlet_info(actor: str, outlet: str) -> dict[str, Any]:
     """Retrieves outlet information from the NPS."""
@@ -49,7 +61,11 @@ async def outlet_info(actor: str, outlet: str) -> dict[str, Any]:
         if cmd.status.did_fail:
             raise RuntimeError(f"Command '{actor} status {outlet}' failed.")
 
-    return cmd.replies.get("outlet_info")
+    info = cmd.replies.get("outlet_info")
+    if isinstance(info, dict) and "id" in info:
+        _OUTLET_IDS[(actor, outlet)] = info["id"]
+
+    return info
 
 
 @Retrier(max_attempts=3, delay=1, timeout=30)
@@ -60,6 +76,7 @@ async def valve_on_off(
     timeout: float | None = None,
     use_script: bool = True,
     dry_run: bool = False,
+    check_estops: bool = True,
 ) -> int | None:
     """Turns a valve on/off.
 
@@ -80,6 +97,9 @@ async def valve_on_off(
         block until the timeout is reached.
     dry_run
         Does not send the command to the NPS.
+    check_estops
+        Whether to check if the LN2 e-stops are active before commanding the
+        valve. Can be disabled if the caller has already checked them.
 
     Returns
     -------
@@ -91,15 +111,18 @@ async def valve_on_off(
 
     # Check if the LN2 e-stops are active. If so we cannot operate the valves
     # because the NPSs that control them will be powered off.
-    if await ln2_estops():
+    if check_estops and await ln2_estops():
         raise RuntimeError("Cannot operate LN2 valves: e-stops are active.")
 
     is_script: bool = False
 
     if on is True and isinstance(timeout, (int, float)) and use_script is True:
-        # First we need to get the outlet number.
-        info = await outlet_info(actor, outlet_name)
-        id_ = info["id"]
+        # First we need to get the outlet number. Use the cached value if the
+        # outlet has already been queried, e.g., when checking the NPS.
+        id_ = _OUTLET_IDS.get((actor, outlet_name))
+        if id_ is None:
+            info = await outlet_info(actor, outlet_name)
+            id_ = info["id"]
 
         command_string = f"scripts run cycle_with_timeout {id_} {timeout}"
         is_script = True
@@ -134,11 +157,13 @@ async def cancel_nps_threads(actor: str, thread_id: int | None = None):
     actor
         The name of the NPS actor to command.
     thread_id
-        The thread ID to cancel. If `None`, all threads in the NPS will be cancelled.
+        The thread ID to cancel. If `None`, all threads in the NPS will be cancelled
+        with a single command. Note that this includes the timeout scripts of any
+        other valve connected to the same NPS.
 
     """
 
-    command_string = f"scripts stop {thread_id if thread_id else ''}"
+    command_string = f"scripts stop {thread_id if thread_id is not None else ''}"
 
     async with CluClient() as client:
         await client.send_command(actor, command_string)
@@ -149,20 +174,39 @@ async def close_all_valves(config: Configuration | None = None, dry_run: bool =
     """Closes all the outlets."""
 
     config = config or get_internal_config()
-    valve_info = config["valve_info"]
+    valve_info: dict[str, dict[str, Any]] = config["valve_info"]
+
+    # Check the e-stops once instead of once per valve. This avoids sending
+    # a burst of identical commands to the bus when closing all the valves.
+    if await ln2_estops():
+        raise RuntimeError("Cannot operate LN2 valves: e-stops are active.")
 
-    await asyncio.gather(
+    # Wait for all the valves to be commanded, even if one of them fails, and
+    # only then report the failures.
+    results = await asyncio.gather(
         *[
             valve_on_off(
-                valve_info[valve]["actor"],
-                valve_info[valve]["outlet"],
+                info["actor"],
+                info["outlet"],
                 False,
                 dry_run=dry_run,
+                check_estops=False,
             )
-            for valve in valve_info
-        ]
+            for info in valve_info.values()
+        ],
+        return_exceptions=True,
     )
 
+    errors = {
+        valve: result
+        for valve, result in zip(valve_info, results)
+        if isinstance(result, BaseException)
+    }
+    if len(errors) > 0:
+        raise RuntimeError(f"Failed closing valves: {', '.join(errors)}.") from next(
+            iter(errors.values())
+        )
+
 
 @dataclass
 class ValveHandler:
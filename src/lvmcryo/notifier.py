@@ -8,6 +8,7 @@
 
 from __future__ import annotations
 
+import asyncio
 import pathlib
 import re
 import smtplib
@@ -74,6 +75,9 @@ class Notifier:
         self.slack_disabled: bool = False
         self.email_disabled: bool = False
 
+        # Keep references to background tasks so they are not garbage collected.
+        self._background_tasks: set[asyncio.Task] = set()
+
     def __repr__(self):
         return f"<Notifier (disabled={str(self.disabled).lower()})>"
 
@@ -128,6 +132,26 @@ class Notifier:
 
         return True
 
+    def post_to_slack_nowait(
+        self,
+        text: str | None = None,
+        level: NotificationLevel = NotificationLevel.info,
+        channel: str | None = None,
+    ):
+        """Posts a message to Slack in the background without waiting.
+
+        Use this for status messages that should not block the caller. The
+        parameters are the same as for :obj:`.post_to_slack`. Returns the task.
+
+        """
+
+        task = asyncio.create_task(self.post_to_slack(text, level, channel))
+
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+        return task
+
     def send_email(
         self,
         html_message: str | None = None,
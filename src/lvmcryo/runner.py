@@ -9,22 +9,27 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import functools
 import inspect
+import io
 import itertools
 import logging
+import math
 import os
 import pathlib
+import shutil
 import signal
 import sys
+import tempfile
 from datetime import timedelta
-from logging import FileHandler
-from tempfile import NamedTemporaryFile
 
-from typing import TYPE_CHECKING, Literal
+from typing import TYPE_CHECKING, Any, Coroutine, Literal
 
 import httpx
+import numpy
 import polars
+from pydantic_core import from_json
 from rich.prompt import Confirm
 
 from sdsstools.logger import get_logger
@@ -45,8 +50,10 @@ from lvmcryo.notifier import Notifier
 from lvmcryo.tools import (
     DBHandler,
     LockExistsError,
+    QueuedFileHandler,
     add_json_handler,
     ensure_lock,
+    get_http_client,
     get_lockfile_path,
     register_parameter_origin,
 )
@@ -54,11 +61,18 @@ from lvmcryo.validate import validate_fill
 
 
 if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+    from pydantic import BaseModel
+
     from sdsstools.logger import SDSSLogger
 
 __all__ = ["fill_runner", "ln2_runner"]
 
 
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+
+
 async def signal_handler(handler: LN2Handler, log: logging.Logger):
     """Handles signals to close all valves and exit cleanly."""
 
@@ -73,9 +87,9 @@ async def signal_handler(handler: LN2Handler, log: logging.Logger):
 
     await handler.clear()
 
-    handler.event_times.fail_time = get_now()
-    handler.event_times.abort_time = get_now()
-    handler.event_times.end_time = get_now()
+    now = get_now()
+    event_times = handler.event_times
+    event_times.fail_time = event_times.abort_time = event_times.end_time = now
 
     log.error("Exiting now. No data or notifications will be sent.")
 
@@ -88,6 +102,52 @@ async def signal_handler(handler: LN2Handler, log: logging.Logger):
     sys.exit(1)
 
 
+def _schedule_signal_handler(handler: LN2Handler, log: logging.Logger):
+    """Schedules :obj:`.signal_handler` as a task. Used as the signal callback."""
+
+    asyncio.create_task(signal_handler(handler, log))
+
+
+@contextlib.contextmanager
+def _install_signal_handlers(handler: LN2Handler, log: logging.Logger):
+    """Handles SIGINT and SIGTERM with :obj:`.signal_handler` within the context."""
+
+    loop = asyncio.get_running_loop()
+
+    installed: list[signal.Signals] = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            # The arguments are bound when the handler is registered.
+            loop.add_signal_handler(signum, _schedule_signal_handler, handler, log)
+            installed.append(signum)
+        except NotImplementedError:  # pragma: no cover
+            # Signal handlers are not supported by the event loop on Windows.
+            log.warning(f"Cannot register a handler for {signum.name}.")
+
+    try:
+        yield
+    finally:
+        for signum in installed:
+            loop.remove_signal_handler(signum)
+
+
+class _LazyJSON:
+    """Defers dumping a model to JSON until a log record is formatted.
+
+    The result is cached since each handler formats the record independently.
+
+    """
+
+    def __init__(self, model: BaseModel):
+        self.model = model
+        self._json: str | None = None
+
+    def __str__(self):
+        if self._json is None:
+            self._json = self.model.model_dump_json(indent=2)
+        return self._json
+
+
 class LN2RunnerError(Exception):
     """An error occurred during the LN2 runner execution."""
 
@@ -308,6 +368,7 @@ async def ln2_runner(
 
         config = Config(**config_params, version=__version__)
         internal_config = config.internal_config
+        api_routes: dict[str, str] = internal_config["api_routes"]
     except Exception as err:
         raise LN2RunnerError(f"Error parsing configuration: {err!r}") from err
 
@@ -323,256 +384,310 @@ async def ln2_runner(
     skip_finally: bool = False
 
     json_path: pathlib.Path | None = None
-    json_handler: FileHandler | None = None
+    json_handler: logging.StreamHandler | QueuedFileHandler | None = None
     images: dict[str, pathlib.Path | None] = {}
 
-    if config.write_log and config.log_path:
-        log.start_file_logger(str(config.log_path))
-
-        if config.write_json:
-            json_path = config.log_path.with_suffix(".json")
-            json_handler = add_json_handler(log, json_path)
-
-    else:
-        # We're still creating log files, but to a temporary location. This is
-        # just to be able to send the log body in a notification email and include
-        # it when loading the DB.
-        temp_file = NamedTemporaryFile()
-        log.start_file_logger(temp_file.name)
-        json_path = pathlib.Path(temp_file.name).with_suffix(".json")
-        json_handler = add_json_handler(log, json_path)
-
-    if verbose:
-        log.sh.setLevel(5)
-    if quiet:
-        log.sh.setLevel(30)
-
-    # Always create a notifier. If the element is disabled the
-    # notifier won't do anything. This simplifies the code.
-    notifier = Notifier(internal_config)
-    notifier.disabled = not config.notify
-    notifier.slack_disabled = not config.slack
-    notifier.email_disabled = not config.email
-
-    if not config.notify:
-        log.debug("Notifications are disabled and will not be emitted.")
-
-    if config.config_file is not None:
-        log.info(f"Using configuration file: {config.config_file!s}")
-
-    if not config.no_prompt:
-        stdout_console.print(f"Action {config.action.value} will run with:")
-        stdout_console.print(config.model_dump())
-        if not Confirm.ask(
-            "Continue with this configuration?",
-            default=False,
-            show_default=True,
-            console=stdout_console,
-        ):
-            return False
-
-    # Create the LN2 handler.
-    try:
-        handler = LN2Handler(
-            config.cameras,
-            interactive=config.interactive == "yes",
-            log=log,
-            valve_info=config.valve_info,
-            dry_run=config.dry_run,
-            alerts_route=internal_config["api_routes"]["alerts"],
-            check_o2_sensors=config.check_o2_sensors,
-        )
-    except Exception as err:
-        raise LN2RunnerError(
-            f"Error creating LN2 handler: {err!r}",
-            propagate=config.with_traceback,
-        ) from err
+    # Clean-up callbacks to run when the runner exits, however it exits.
+    async with contextlib.AsyncExitStack() as cleanup:
+        # Share one HTTP client, and its connection pool, for all the API calls.
+        http_client = httpx.AsyncClient(follow_redirects=True)
+        cleanup.push_async_callback(http_client.aclose)
 
-    lockfile_path = get_lockfile_path()
+        if config.write_log and config.log_path:
+            log.start_file_logger(str(config.log_path))
 
-    if lockfile_path.exists() and config.clear_lock:
-        log.warning("Lock file exists. Removing it because --clear-lock.")
-        lockfile_path.unlink()
+            if config.write_json:
+                json_path = config.log_path.with_suffix(".json")
+                json_handler = add_json_handler(log, json_path)
 
-        log.info("Waiting 10 seconds for other processes to stop.")
-        await asyncio.sleep(10)
+                # Detach the handler and stop its writer thread when we exit.
+                cleanup.callback(json_handler.close)
+                cleanup.callback(log.removeHandler, json_handler)
 
-    try:
-        db_handler = DBHandler(
-            action.value,
-            handler,
-            config,
-            json_handler=json_handler,
-        )
-        record_pk = await db_handler.update(complete=False)
-        if record_pk:
-            log.debug(f"Record {record_pk} created in the database.")
-    except Exception as err:
-        raise LN2RunnerError(
-            f"Error creating database record: {err!r}",
-            propagate=config.with_traceback,
-        ) from err
+        else:
+            # We're still creating a log file, but to a temporary location. This is
+            # just to be able to send the log body in a notification email. The JSON
+            # log is only included when loading the DB so we keep it in memory. The
+            # temporary directory is removed, with any rotated logs, when we exit.
+            temp_dir = pathlib.Path(tempfile.mkdtemp(prefix="lvmcryo-"))
+            cleanup.callback(shutil.rmtree, temp_dir, ignore_errors=True)
+
+            log.start_file_logger(str(temp_dir / "lvmcryo.log"))
+            json_handler = add_json_handler(log)
+
+            # Detach the in-memory handler when we exit.
+            cleanup.callback(json_handler.close)
+            cleanup.callback(log.removeHandler, json_handler)
+
+        if verbose:
+            log.sh.setLevel(5)
+        if quiet:
+            log.sh.setLevel(30)
+
+        # Always create a notifier. If the element is disabled the
+        # notifier won't do anything. This simplifies the code.
+        notifier = Notifier(internal_config)
+        notifier.disabled = not config.notify
+        notifier.slack_disabled = not config.slack
+        notifier.email_disabled = not config.email
+
+        if not config.notify:
+            log.debug("Notifications are disabled and will not be emitted.")
+
+        if config.config_file is not None:
+            log.info(f"Using configuration file: {config.config_file!s}")
+
+        if not config.no_prompt:
+            stdout_console.print(f"Action {config.action.value} will run with:")
+            stdout_console.print(config.model_dump())
+            if not Confirm.ask(
+                "Continue with this configuration?",
+                default=False,
+                show_default=True,
+                console=stdout_console,
+            ):
+                return False
 
-    try:
-        async with ensure_lock(
-            lockfile_path,
-            monitor=True,
-            log=log,
-            on_release_callback=functools.partial(
-                handler.abort,
-                raise_error=False,
-                close_valves=True,
-            ),
-        ):
-            # Calculate the expected maximum run time.
-            max_time: float = 2 * 3600  # It should never take longer than two hours.
-            if config.max_purge_time is not None and config.max_fill_time is not None:
-                max_time = config.max_purge_time + config.max_fill_time + 300.0
-
-            # Run worker.
-            await asyncio.wait_for(
-                fill_runner(
-                    handler,
-                    config,
-                    notifier,
-                    db_handler=db_handler,
-                ),
-                timeout=max_time,
+        # Create the LN2 handler.
+        try:
+            handler = LN2Handler(
+                config.cameras,
+                interactive=config.interactive == "yes",
+                log=log,
+                valve_info=config.valve_info,
+                dry_run=config.dry_run,
+                alerts_route=api_routes["alerts"],
+                check_o2_sensors=config.check_o2_sensors,
+                http_client=http_client,
             )
+        except Exception as err:
+            raise LN2RunnerError(
+                f"Error creating LN2 handler: {err!r}",
+                propagate=config.with_traceback,
+            ) from err
+
+        lockfile_path = get_lockfile_path()
+
+        if config.clear_lock:
+            try:
+                lockfile_path.unlink()
+            except FileNotFoundError:
+                pass
+            else:
+                log.warning("Lock file existed. Removed it because --clear-lock.")
+                log.info("Waiting 10 seconds for other processes to stop.")
+                await asyncio.sleep(10)
 
-            # Check handler status.
-            if handler.failed:
-                raise RuntimeError(
-                    "No exceptions were raised but the LN2 handler reports a failure."
-                )
-
-    except LockExistsError:
-        if config.notify:
-            log.warning("Sending failure notifications.")
-            await notifier.notify_after_fill(
-                False,
-                error_message=f"LN2 {config.action.value} failed because a lockfile "
-                "was already present.",
+        try:
+            db_handler = DBHandler(
+                action.value,
+                handler,
+                config,
+                json_handler=json_handler,
+                client=http_client,
             )
+            record_pk = await db_handler.update(complete=False)
+            if record_pk:
+                log.debug(f"Record {record_pk} created in the database.")
+        except Exception as err:
+            raise LN2RunnerError(
+                f"Error creating database record: {err!r}",
+                propagate=config.with_traceback,
+            ) from err
 
-        # Do not do anything special for this error, just exit.
-        skip_finally = True
-
-        raise
-
-    except Exception as err:
-        # Log the traceback to file but do not print.
-        orig_sh_level = log.sh.level
-        log.sh.setLevel(1000)
-
-        log.exception(f"Error during {config.action.value}: {err!s}", exc_info=err)
-        if isinstance(err, asyncio.TimeoutError):
-            log.error("One or more operations timed out.")
+        try:
+            async with ensure_lock(
+                lockfile_path,
+                monitor=True,
+                log=log,
+                on_release_callback=functools.partial(
+                    handler.abort,
+                    raise_error=False,
+                    close_valves=True,
+                ),
+            ):
+                # Calculate the expected maximum run time. It should never take
+                # longer than two hours.
+                max_time: float = 2 * 3600
+                if (
+                    config.max_purge_time is not None
+                    and config.max_fill_time is not None
+                ):
+                    max_time = config.max_purge_time + config.max_fill_time + 300.0
+
+                # Run worker. Signals trigger a valve shutdown and clean exit.
+                with _install_signal_handlers(handler, log):
+                    await asyncio.wait_for(
+                        fill_runner(
+                            handler,
+                            config,
+                            notifier,
+                            db_handler=db_handler,
+                        ),
+                        timeout=max_time,
+                    )
 
-        log.sh.setLevel(orig_sh_level)
+                # Check handler status.
+                if handler.failed:
+                    raise RuntimeError(
+                        "No exceptions were raised but the LN2 handler "
+                        "reports a failure."
+                    )
 
-        # Fail the action.
-        handler.failed = True
-        skip_finally = True
+        except LockExistsError:
+            if config.notify:
+                log.warning("Sending failure notifications.")
+                await notifier.notify_after_fill(
+                    False,
+                    error_message=f"LN2 {config.action.value} failed because a "
+                    "lockfile was already present.",
+                )
 
-        error = err
-        raise LN2RunnerError(str(err), propagate=config.with_traceback) from err
+            # Do not do anything special for this error, just exit.
+            skip_finally = True
 
-    else:
-        log.info(f"LN2 {config.action.value} completed successfully.")
+            raise
 
-    finally:
-        # At this point all the valves are closed so we can remove the signal handlers.
-        for signame in ("SIGINT", "SIGTERM"):
-            asyncio.get_running_loop().remove_signal_handler(getattr(signal, signame))
+        except Exception as err:
+            # Log the traceback to file but do not print.
+            orig_sh_level = log.sh.level
+            log.sh.setLevel(1000)
 
-        handler.event_times.end_time = get_now()
-        await handler.clear()
+            log.exception(f"Error during {config.action.value}: {err!s}", exc_info=err)
+            if isinstance(err, asyncio.TimeoutError):
+                log.error("One or more operations timed out.")
 
-        log.info(f"Event times:\n{handler.event_times.model_dump_json(indent=2)}")
+            log.sh.setLevel(orig_sh_level)
 
-        # Make sure all valves are closed.
-        try:
-            log.info("Ensuring all valves are closed.")
-            await asyncio.wait_for(
-                handler.stop(only_active=False, close_valves=True),
-                timeout=30,
-            )
-        except Exception as err:
-            log.error(f"Error closing valves before exiting: {err}")
+            # Fail the action.
+            handler.failed = True
+            skip_finally = True
 
-        # Do a quick update of the DB record since post_fill_tasks() may
-        # block for a long time.
-        await db_handler.update(complete=True, error=error)
+            error = err
+            raise LN2RunnerError(str(err), propagate=config.with_traceback) from err
 
-        if not skip_finally:
-            plot_paths = await post_fill_tasks(
-                handler,
-                notifier=notifier,
-                write_data=config.write_data,
-                data_path=config.data_path,
-                data_extra_time=config.data_extra_time if error is None else None,
-                api_data_route=internal_config["api_routes"]["fill_data"],
-            )
+        else:
+            log.info(f"LN2 {config.action.value} completed successfully.")
 
-            if (
-                config.write_data
-                and config.data_path
-                and config.data_path.exists()
-                and not error
-            ):
-                validate_failed, validate_error = validate_fill(
-                    handler,
-                    config,
-                    log=log,
-                )
-                if validate_failed and error is None:
-                    await notifier.post_to_slack(
-                        "Fill validation failed. Check the log for details.",
-                        level=NotificationLevel.error,
-                    )
-                    handler.failed = True
-                    error = RuntimeError(validate_error)
-                elif not validate_failed:
-                    log.info("Fill validation completed successfully.")
+        finally:
+            handler.event_times.end_time = get_now()
+            await handler.clear()
 
-            log.info("Writing fill metadata to database.")
-            await db_handler.update(complete=True, plot_paths=plot_paths, error=error)
+            log.info("Event times:\n%s", _LazyJSON(handler.event_times))
 
-            if config.notify:
-                images = {
-                    "pressure": plot_paths.get("pressure_png", None),
-                    "temps": plot_paths.get("temps_png", None),
-                    "thermistors": plot_paths.get("thermistors_png", None),
-                }
-
-                if error:
-                    log.warning("Sending failure notifications.")
-                    await notifier.notify_after_fill(
-                        False,
-                        error_message=error,
-                        handler=handler,
-                        images=images,
-                        record_pk=record_pk,
+            # Make sure all valves are closed.
+            if not handler.valves_closed:
+                try:
+                    log.info("Ensuring all valves are closed.")
+                    await asyncio.wait_for(
+                        handler.stop(only_active=False, close_valves=True),
+                        timeout=30,
                     )
+                except Exception as err:
+                    log.error(f"Error closing valves before exiting: {err}")
 
-                elif config.email_level == NotificationLevel.info:
-                    # The handler has already emitted a notification to
-                    # Slack so just send an email.
+            # Do a quick update of the DB record since post_fill_tasks() may
+            # block for a long time.
+            db_update = db_handler.update(complete=True, error=error)
 
-                    # TODO: include log and more data here.
-                    # For now it's just plain text.
+            if skip_finally:
+                await db_update
+            else:
+                # The DB update and the data retrieval are independent so we run
+                # them concurrently.
+                extra_time = config.data_extra_time if error is None else None
+                db_result, plot_paths = await asyncio.gather(
+                    db_update,
+                    post_fill_tasks(
+                        handler,
+                        notifier=notifier,
+                        write_data=config.write_data,
+                        data_path=config.data_path,
+                        data_extra_time=extra_time,
+                        api_data_route=api_routes["fill_data"],
+                        client=http_client,
+                    ),
+                    return_exceptions=True,
+                )
 
-                    log.info("Sending notification email.")
-                    await notifier.notify_after_fill(
-                        True,
-                        handler=handler,
-                        images=images,
-                        post_to_slack=False,  # Already done.
-                        record_pk=record_pk,
+                if isinstance(db_result, BaseException):
+                    log.error(f"Error updating the database record: {db_result!r}")
+
+                if isinstance(plot_paths, BaseException):
+                    log.error(f"Error running post-fill tasks: {plot_paths!r}")
+                    plot_paths = {}
+
+                if (
+                    config.write_data
+                    and config.data_path
+                    and config.data_path.exists()
+                    and not error
+                ):
+                    validate_failed, validate_error = validate_fill(
+                        handler,
+                        config,
+                        log=log,
                     )
-
-        await db_handler.update()
+                    if validate_failed and error is None:
+                        await notifier.post_to_slack(
+                            "Fill validation failed. Check the log for details.",
+                            level=NotificationLevel.error,
+                        )
+                        handler.failed = True
+                        error = RuntimeError(validate_error)
+                    elif not validate_failed:
+                        log.info("Fill validation completed successfully.")
+
+                log.info("Writing fill metadata to database.")
+                final_tasks: list[Coroutine] = [
+                    db_handler.update(complete=True, plot_paths=plot_paths, error=error)
+                ]
+
+                if config.notify:
+                    images = {
+                        "pressure": plot_paths.get("pressure_png", None),
+                        "temps": plot_paths.get("temps_png", None),
+                        "thermistors": plot_paths.get("thermistors_png", None),
+                    }
+
+                    if error:
+                        log.warning("Sending failure notifications.")
+                        final_tasks.append(
+                            notifier.notify_after_fill(
+                                False,
+                                error_message=error,
+                                handler=handler,
+                                images=images,
+                                record_pk=record_pk,
+                            )
+                        )
+
+                    elif config.email_level == NotificationLevel.info:
+                        # The handler has already emitted a notification to
+                        # Slack so just send an email.
+
+                        # TODO: include log and more data here.
+                        # For now it's just plain text.
+
+                        log.info("Sending notification email.")
+                        final_tasks.append(
+                            notifier.notify_after_fill(
+                                True,
+                                handler=handler,
+                                images=images,
+                                post_to_slack=False,  # Already done.
+                                record_pk=record_pk,
+                            )
+                        )
+
+                # The DB record and the notifications are independent. Run them
+                # concurrently and report errors individually.
+                results = await asyncio.gather(*final_tasks, return_exceptions=True)
+                for result in results:
+                    if isinstance(result, BaseException):
+                        log.error(f"Error running post-fill task: {result!r}")
+
+            await db_handler.update()
 
 
 async def fill_runner(
@@ -597,10 +712,11 @@ async def fill_runner(
     # Record options used. If in no_promp is False (the default), the full
     # configuration has already been printed for confirmation, so we only
     # save this with debug level.
-    config_json = config.model_dump_json(indent=2)
     log.log(
         logging.INFO if config.no_prompt else logging.DEBUG,
-        f"Running {config.action.value} with configuration:\n{config_json}",
+        "Running %s with configuration:\n%s",
+        config.action.value,
+        _LazyJSON(config),
     )
 
     if config.dry_run:
@@ -636,13 +752,6 @@ async def fill_runner(
         check_o2_sensors=config.check_o2_sensors,
     )
 
-    # Register signals that will trigger a valve shutdown and clean exit.
-    for signame in ("SIGINT", "SIGTERM"):
-        asyncio.get_running_loop().add_signal_handler(
-            getattr(signal, signame),
-            lambda: asyncio.create_task(signal_handler(handler, log)),
-        )
-
     log.info(f"Closing all valves before {action}.")
     await close_all_valves(dry_run=config.dry_run)
 
@@ -651,7 +760,8 @@ async def fill_runner(
         raise RuntimeError("The LN2 handler was aborted before starting the fill.")
 
     if config.action == Actions.purge_fill or config.action == Actions.purge:
-        await notifier.post_to_slack("Starting purge.")
+        # Status message. Do not block the valve operations while posting it.
+        notifier.post_to_slack_nowait("Starting purge.")
         max_purge_time = config.purge_time or config.max_purge_time
         await asyncio.wait_for(
             handler.purge(
@@ -669,7 +779,8 @@ async def fill_runner(
             raise RuntimeError(handler.error or "Purge failed or was aborted.")
 
     if config.action == Actions.purge_fill or config.action == Actions.fill:
-        await notifier.post_to_slack("Starting fill.")
+        # Status message. Do not block the valve operations while posting it.
+        notifier.post_to_slack_nowait("Starting fill.")
         max_fill_time = config.fill_time or config.max_fill_time
         await asyncio.wait_for(
             handler.fill(
@@ -701,6 +812,7 @@ async def post_fill_tasks(
     data_extra_time: float | None = None,
     api_data_route: str = "http://lvm-hub.lco.cl:8090/api/spectrographs/fills/measurements",
     generate_data_plots: bool = True,
+    client: httpx.AsyncClient | None = None,
 ) -> dict[str, pathlib.Path]:
     """Runs the post-fill tasks.
 
@@ -718,6 +830,9 @@ async def post_fill_tasks(
         The API route to retrive the fill data.
     generate_data_plots
         Whether to generate plots from the data.
+    client
+        An HTTP client to use to retrieve the data. If not provided, a new
+        client is created.
 
     Returns
     -------
@@ -774,43 +889,35 @@ async def post_fill_tasks(
             log.info("Retrieving and writing measurements.")
 
             end_time = event_times.end_time + timedelta(seconds=data_extra_time or 0.0)
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                response = await client.get(
-                    api_data_route,
-                    params={
-                        "start_time": int(event_times.start_time.timestamp()),
-                        "end_time": int(end_time.timestamp()),
-                    },
+            start_ts = int(event_times.start_time.timestamp())
+            end_ts = int(end_time.timestamp())
+
+            data = await _fetch_fill_data(api_data_route, start_ts, end_ts, client)
+
+            data_path.parent.mkdir(parents=True, exist_ok=True)
+
+            # Writing the data is I/O bound and independent from the plots,
+            # so we do both at the same time. The file is small and always
+            # read in full, so skip computing the per-column statistics.
+            write_task = asyncio.create_task(
+                run_in_executor(
+                    data.write_parquet,
+                    data_path,
+                    compression="zstd",
+                    compression_level=3,
+                    statistics=False,
                 )
-                response.raise_for_status()
-
-                data = (
-                    polars.DataFrame(response.json())
-                    .with_columns(polars.col.time.cast(polars.Datetime("ms")))
-                    .sort("time")
-                    .drop_nulls()
-                )
-
-                data_path.parent.mkdir(parents=True, exist_ok=True)
-                data.write_parquet(data_path)
-                log.debug(f"Fill data written to {data_path!s}")
+            )
 
+            try:
                 if generate_data_plots:
                     log.debug("Generating plots.")
                     plot_path_root = str(data_path.with_suffix(""))
-                    plot_paths = await run_in_executor(
-                        generate_plots,
-                        data,
-                        plot_path_root,
-                    )
-                    plot_paths_transparent = await run_in_executor(
-                        generate_plots,
-                        data,
-                        plot_path_root,
-                        transparent=True,
-                    )
-                    plot_paths.update(plot_paths_transparent)
+                    plot_paths = await _generate_all_plots(data, plot_path_root)
                     log.debug(f"Plots saved to {plot_path_root}*.")
+            finally:
+                await write_task
+                log.debug(f"Fill data written to {data_path!s}")
 
         except Exception as ee:
             log.error(f"Failed to retrieve fill data from API: {ee!r}")
@@ -818,11 +925,69 @@ async def post_fill_tasks(
     return plot_paths
 
 
+async def _fetch_fill_data(
+    api_data_route: str,
+    start_ts: int,
+    end_ts: int,
+    client: httpx.AsyncClient | None = None,
+) -> polars.DataFrame:
+    """Retrieves the fill measurements from the API."""
+
+    async with get_http_client(client) as http_client:
+        response = await http_client.get(
+            api_data_route,
+            params={"start_time": start_ts, "end_time": end_ts},
+            headers={"Accept": f"{ARROW_STREAM_MIME}, application/json"},
+        )
+        response.raise_for_status()
+
+    # Prefer the Arrow IPC stream, which polars reads without building
+    # intermediate Python objects. Fall back to JSON if the API does not
+    # support it. pydantic-core's JSON parser is significantly faster than
+    # the standard library one used by response.json().
+    content_type = response.headers.get("content-type", "")
+    if content_type.startswith(ARROW_STREAM_MIME):
+        measurements = polars.read_ipc_stream(io.BytesIO(response.content))
+    else:
+        measurements = polars.DataFrame(from_json(response.content))
+
+    return (
+        measurements.with_columns(polars.col.time.cast(polars.Datetime("ms")))
+        .sort("time")
+        .drop_nulls()
+    )
+
+
+async def _generate_all_plots(data: polars.DataFrame, plot_path_root: str):
+    """Generates the regular and transparent plots.
+
+    The plots are rendered in an executor so that they do not block the event
+    loop. Matplotlib is not thread-safe and the plot style is applied through
+    its global configuration, so the two sets of plots are generated one after
+    the other.
+
+    """
+
+    plot_paths: dict[str, pathlib.Path] = {}
+
+    for transparent in (False, True):
+        result = await run_in_executor(
+            generate_plots,
+            data,
+            plot_path_root,
+            transparent,
+        )
+        plot_paths.update(result)
+
+    return plot_paths
+
+
 def generate_plots(
     data: polars.DataFrame,
     plot_path_root: str,
     transparent: bool = False,
-    include_ccd_tempratures: bool = False,
+    include_ccd_temperatures: bool = False,
+    pdf: bool = False,
 ):
     """Generates measurement plots.
 
@@ -837,8 +1002,11 @@ def generate_plots(
         Whether to save the plots with a transparent background. The colours will
         be adjusted to be visible on a dark background. The paths will be suffixed
         with ``_transparent``. No PDFs will be generated in this case.
-    include_ccd_tempratures
+    include_ccd_temperatures
         Whether to include CCD temperatures in the temperature plot.
+    pdf
+        Whether to also save the plots as PDF. Vector PDFs of dense time series
+        are slow to render so by default only PNGs are generated.
 
     Returns
     -------
@@ -847,57 +1015,279 @@ def generate_plots(
 
     """
 
-    import matplotlib.pyplot as plt
+    from matplotlib import style
 
     paths: dict[str, pathlib.Path] = {}
 
-    colours: dict[str, str] = {
+    with style.context(_get_plot_style(transparent)):
+        # Reuse the same figure and axes for all the plots. Creating a new
+        # figure for each plot is a large fixed cost.
+        ax = _get_plot_axes()
+
+        paths.update(
+            _plot_pressures(
+                data,
+                plot_path_root,
+                transparent,
+                pdf=pdf,
+                ax=ax,
+            )
+        )
+        paths.update(
+            _plot_temperatures(
+                data,
+                plot_path_root,
+                transparent,
+                include_ccd_temperatures=include_ccd_temperatures,
+                pdf=pdf,
+                ax=ax,
+            )
+        )
+        paths.update(
+            _plot_thermistors(
+                data,
+                plot_path_root,
+                transparent,
+                pdf=pdf,
+                ax=ax,
+            )
+        )
+
+    return paths
+
+
+def _get_plot_style(transparent: bool = False) -> list[str | dict[str, Any]]:
+    """Returns the Matplotlib style for the plots."""
+
+    # Simplify line segments smaller than one pixel. The time series are dense
+    # and this significantly reduces the work done by the Agg renderer.
+    render_params = {
+        "path.simplify": True,
+        "path.simplify_threshold": 1.0,
+        "agg.path.chunksize": 10000,
+    }
+
+    if transparent:
+        return ["dark_background", render_params]
+
+    return [
+        "seaborn-v0_8-whitegrid",
+        {
+            "axes.facecolor": "white",
+            "figure.facecolor": "white",
+            "savefig.facecolor": "white",
+        },
+        render_params,
+    ]
+
+
+def _get_plot_colours(transparent: bool = False) -> dict[str, str]:
+    """Returns the line colours for each camera."""
+
+    return {
         "r": "red",
         "b": "cyan" if transparent else "blue",
         "z": "magenta",
     }
-    linestyles: dict[str, str] = {"1": "-", "2": "--", "3": "-."}
 
-    transparent_suffix = "_transparent" if transparent else ""
 
-    date = data[0, "time"].strftime("%Y-%m-%d")
+PLOT_LINESTYLES: dict[str, str] = {"1": "-", "2": "--", "3": "-."}
+
+# Plotted channels as (spectrograph, camera, ..., column name).
+PRESSURE_CHANNELS: tuple[tuple[str, str, str], ...] = tuple(
+    (spec, camera, f"pressure_{camera}{spec}")
+    for spec, camera in itertools.product("123", "brz")
+)
+TEMPERATURE_CHANNELS: tuple[tuple[str, str, str, str], ...] = tuple(
+    (spec, camera, sensor, f"temp_{camera}{spec}_{sensor}")
+    for spec, camera, sensor in itertools.product("123", "brz", ("ln2", "ccd"))
+)
+THERMISTOR_CHANNELS: tuple[tuple[str, str], ...] = tuple(
+    (channel, f"thermistor_{channel}")
+    for channel in (
+        "supply",
+        *(f"{camera}{spec}" for spec, camera in itertools.product("123", "brz")),
+    )
+)
 
-    with plt.ioff():
-        if transparent:
-            plt.style.use("dark_background")
-        else:
-            plt.style.use("seaborn-v0_8-whitegrid")
-            plt.rcParams["axes.facecolor"] = "white"
-            plt.rcParams["figure.facecolor"] = "white"
-            plt.rcParams["savefig.facecolor"] = "white"
 
-        # Pressures
-        fig, ax = plt.subplots(figsize=(12, 8))
+PLOT_MAX_POINTS: int = 2000
 
-        pressures = data.select(
-            polars.col.time,
-            polars.selectors.starts_with("pressure_"),
+
+def _downsample(
+    times: numpy.ndarray,
+    values: numpy.ndarray,
+    max_points: int = PLOT_MAX_POINTS,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Downsamples a time series for plotting.
+
+    The series is split in buckets and only the minimum and maximum of each
+    bucket are kept, which preserves spikes and steps at the plot resolution.
+    Series with fewer than ``max_points`` points are returned unchanged.
+
+    """
+
+    n_points = len(values)
+    if n_points <= max_points:
+        return times, values
+
+    # Use full buckets and, if the size does not divide the number of points,
+    # a last, shorter bucket so that no points at the end are dropped.
+    n_buckets = max_points // 2
+    bucket_size = math.ceil(n_points / n_buckets)
+    n_full = n_points // bucket_size
+    n_full_points = n_full * bucket_size
+
+    buckets = values[:n_full_points].reshape(n_full, bucket_size)
+    offsets = numpy.arange(n_full) * bucket_size
+
+    selected = [
+        [0, n_points - 1],
+        buckets.argmin(axis=1) + offsets,
+        buckets.argmax(axis=1) + offsets,
+    ]
+
+    remainder = values[n_full_points:]
+    if len(remainder) > 0:
+        selected.append(
+            [
+                remainder.argmin() + n_full_points,
+                remainder.argmax() + n_full_points,
+            ]
         )
 
-        for spec, camera in itertools.product("123", "brz"):
-            column = f"pressure_{camera}{spec}"
-            if column not in pressures.columns:
-                continue
+    indices = numpy.unique(numpy.concatenate(selected))
 
-            cam_pressure = pressures[column].to_numpy()
+    return times[indices], values[indices]
 
-            colour = colours.get(camera, "w" if transparent else "k")
-            linestyle = linestyles.get(spec, "-")
 
-            label = f"{camera}{spec}"
+def _plot_series(
+    ax: Axes,
+    time_data: numpy.ndarray,
+    values: numpy.ndarray,
+    line_props: list[dict[str, Any]],
+):
+    """Plots each column in ``values`` against ``time_data`` in a single call.
 
-            ax.plot(
-                pressures["time"].to_numpy(),
-                cam_pressure,
-                label=label,
-                color=colour,
-                linestyle=linestyle,
-            )
+    Each series is downsampled independently so they are passed to
+    ``ax.plot`` as ``x1, y1, x2, y2, ...`` pairs. ``line_props`` is a list
+    with the line properties (label, colour, etc.) for each column.
+
+    """
+
+    xy_pairs: list[numpy.ndarray] = []
+    for ii in range(len(line_props)):
+        xy_pairs.extend(_downsample(time_data, values[:, ii]))
+
+    if len(xy_pairs) == 0:
+        return []
+
+    lines = ax.plot(*xy_pairs)
+    for line, props in zip(lines, line_props):
+        line.set(**props)
+
+    return lines
+
+
+def _get_plot_axes(ax: Axes | None = None) -> Axes:
+    """Returns a clean axes. Creates a new figure if ``ax`` is not passed."""
+
+    # Use the object-oriented API instead of pyplot to avoid the global figure
+    # manager. Attach the Agg canvas explicitly so that saving to PNG does not
+    # need to switch canvases and the renderer can be reused between saves.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if ax is None:
+        fig = Figure(figsize=(12, 8))
+        FigureCanvasAgg(fig)
+        return fig.subplots()
+
+    ax.clear()
+
+    return ax
+
+
+def _savefig_atomic(fig: Figure, path: str, **kwargs):
+    """Saves a figure to a temporary file and then moves it to ``path``.
+
+    The rename is atomic so readers never see a partially written plot. The
+    ``format`` must be passed since it cannot be inferred from the temporary
+    file extension.
+
+    """
+
+    tmp_path = f"{path}.tmp"
+
+    try:
+        fig.savefig(tmp_path, **kwargs)
+        os.replace(tmp_path, path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+
+
+def _save_plot(
+    fig: Figure,
+    plot_path_root: str,
+    name: str,
+    transparent: bool = False,
+    pdf: bool = False,
+) -> dict[str, pathlib.Path]:
+    """Saves a figure as PNG and, if requested and not transparent, PDF."""
+
+    paths: dict[str, pathlib.Path] = {}
+
+    transparent_suffix = "_transparent" if transparent else ""
+
+    if pdf and not transparent:
+        path = f"{plot_path_root}_{name}{transparent_suffix}.pdf"
+        _savefig_atomic(fig, path, format="pdf", bbox_inches="tight")
+        paths[f"{name}{transparent_suffix}_pdf"] = pathlib.Path(path)
+
+    # The PNGs are only displayed on screen (emails, web) so 150 DPI is enough.
+    # Agg rendering time scales with the number of pixels.
+    path = f"{plot_path_root}_{name}{transparent_suffix}.png"
+    _savefig_atomic(fig, path, format="png", dpi=150, transparent=transparent)
+    paths[f"{name}{transparent_suffix}_png"] = pathlib.Path(path)
+
+    return paths
+
+
+def _plot_pressures(
+    data: polars.DataFrame,
+    plot_path_root: str,
+    transparent: bool = False,
+    pdf: bool = False,
+    ax: Axes | None = None,
+) -> dict[str, pathlib.Path]:
+    """Plots the cryostat pressures during the fill."""
+
+    from matplotlib import style
+
+    colours = _get_plot_colours(transparent)
+    date = data[0, "time"].strftime("%Y-%m-%d")
+
+    with style.context(_get_plot_style(transparent)):
+        ax = _get_plot_axes(ax)
+
+        data_columns = set(data.columns)
+        channels = [ch for ch in PRESSURE_CHANNELS if ch[-1] in data_columns]
+
+        # Convert all the columns to numpy at once.
+        time_data = data["time"].to_numpy()
+        pressures = data.select(ch[-1] for ch in channels).to_numpy()
+
+        line_props = [
+            {
+                "label": f"{camera}{spec}",
+                "color": colours.get(camera, "w" if transparent else "k"),
+                "linestyle": PLOT_LINESTYLES.get(spec, "-"),
+            }
+            for spec, camera, _ in channels
+        ]
+
+        _plot_series(ax, time_data, pressures, line_props)
 
         ax.set_title(f"Pressure during fill — {date}")
         ax.set_xlabel("Time")
@@ -905,51 +1295,56 @@ def generate_plots(
 
         ax.legend(loc="center left", bbox_to_anchor=(1, 0.5), prop={"size": 9})
 
-        plt.ticklabel_format(style="sci", axis="y", scilimits=(0, 0))
-
-        if not transparent:
-            path = f"{plot_path_root}_pressure{transparent_suffix}.pdf"
-            fig.savefig(path)
-            paths[f"pressure{transparent_suffix}_pdf"] = pathlib.Path(path)
+        ax.ticklabel_format(style="sci", axis="y", scilimits=(0, 0))
 
-        path = f"{plot_path_root}_pressure{transparent_suffix}.png"
-        fig.savefig(path, dpi=300, transparent=transparent)
-        paths[f"pressure{transparent_suffix}_png"] = pathlib.Path(path)
+        return _save_plot(
+            ax.figure,
+            plot_path_root,
+            "pressure",
+            transparent=transparent,
+            pdf=pdf,
+        )
 
-        plt.close(fig)
 
-        # Temperatures
-        fig, ax = plt.subplots(figsize=(12, 8))
+def _plot_temperatures(
+    data: polars.DataFrame,
+    plot_path_root: str,
+    transparent: bool = False,
+    include_ccd_temperatures: bool = False,
+    pdf: bool = False,
+    ax: Axes | None = None,
+) -> dict[str, pathlib.Path]:
+    """Plots the cryostat temperatures during the fill."""
 
-        temps = data.select(
-            polars.col.time,
-            polars.selectors.starts_with("temp_"),
-        )
+    from matplotlib import style
 
-        for spec, camera, sensor in itertools.product("123", "brz", ["ln2", "ccd"]):
-            if sensor == "ccd" and not include_ccd_tempratures:
-                continue
+    colours = _get_plot_colours(transparent)
+    date = data[0, "time"].strftime("%Y-%m-%d")
 
-            column = f"temp_{camera}{spec}_{sensor}"
-            if column not in temps.columns:
-                continue
+    with style.context(_get_plot_style(transparent)):
+        ax = _get_plot_axes(ax)
 
-            cam_temp = temps[column].to_numpy()
+        data_columns = set(data.columns)
+        channels = [
+            ch
+            for ch in TEMPERATURE_CHANNELS
+            if ch[-1] in data_columns and (ch[2] == "ln2" or include_ccd_temperatures)
+        ]
 
-            colour = colours.get(camera, "w" if transparent else "k")
-            linestyle = linestyles.get(spec, "-")
-            linewidth = 1.5 if sensor == "ln2" else 1
+        time_data = data["time"].to_numpy()
+        temps = data.select(ch[-1] for ch in channels).to_numpy()
 
-            label = f"{camera}{spec} ({sensor.upper()})"
+        line_props = [
+            {
+                "label": f"{camera}{spec} ({sensor.upper()})",
+                "color": colours.get(camera, "w" if transparent else "k"),
+                "linestyle": PLOT_LINESTYLES.get(spec, "-"),
+                "linewidth": 1.5 if sensor == "ln2" else 1,
+            }
+            for spec, camera, sensor, _ in channels
+        ]
 
-            ax.plot(
-                temps["time"].to_numpy(),
-                cam_temp,
-                label=label,
-                color=colour,
-                linestyle=linestyle,
-                linewidth=linewidth,
-            )
+        _plot_series(ax, time_data, temps, line_props)
 
         ax.set_title(f"Temperature during fill — {date}")
         ax.set_xlabel("Time")
@@ -957,67 +1352,67 @@ def generate_plots(
 
         ax.legend(loc="center left", bbox_to_anchor=(1, 0.5), prop={"size": 9})
 
-        if not transparent:
-            path = f"{plot_path_root}_temps{transparent_suffix}.pdf"
-            fig.savefig(path)
-            paths[f"temps{transparent_suffix}_pdf"] = pathlib.Path(path)
+        return _save_plot(
+            ax.figure,
+            plot_path_root,
+            "temps",
+            transparent=transparent,
+            pdf=pdf,
+        )
 
-        path = f"{plot_path_root}_temps{transparent_suffix}.png"
-        fig.savefig(path, dpi=300, transparent=transparent)
-        paths[f"temps{transparent_suffix}_png"] = pathlib.Path(path)
 
-        plt.close(fig)
+def _plot_thermistors(
+    data: polars.DataFrame,
+    plot_path_root: str,
+    transparent: bool = False,
+    pdf: bool = False,
+    ax: Axes | None = None,
+) -> dict[str, pathlib.Path]:
+    """Plots the thermistor states during the fill."""
 
-        # Thermistors
-        fig, ax = plt.subplots(figsize=(12, 8))
+    from matplotlib import style
 
-        therms = data.select(
-            polars.col.time,
-            polars.selectors.starts_with("thermistor_"),
-        )
+    colours = _get_plot_colours(transparent)
+    date = data[0, "time"].strftime("%Y-%m-%d")
 
-        cameras = ["".join(item)[::-1] for item in itertools.product("123", "brz")]
-        for channel in ["supply"] + cameras:
-            column = f"thermistor_{channel}"
-            if column not in therms.columns:
-                continue
+    with style.context(_get_plot_style(transparent)):
+        ax = _get_plot_axes(ax)
 
-            cam_therm = therms[column].to_numpy()
+        data_columns = set(data.columns)
+        channels = [ch for ch in THERMISTOR_CHANNELS if ch[-1] in data_columns]
 
+        time_data = data["time"].to_numpy()
+        therms = data.select(ch[-1] for ch in channels).to_numpy()
+
+        line_props = []
+        for channel, _ in channels:
             if len(channel) == 2:
                 camera, spec = channel
                 colour = colours.get(camera, "w" if transparent else "k")
-                linestyle = linestyles.get(spec, "-")
+                linestyle = PLOT_LINESTYLES.get(spec, "-")
             else:
                 colour = "g" if transparent else "k"
                 linestyle = "-"
 
-            ax.plot(
-                therms["time"].to_numpy(),
-                cam_therm,
-                label=channel,
-                color=colour,
-                linestyle=linestyle,
+            line_props.append(
+                {"label": channel, "color": colour, "linestyle": linestyle}
             )
 
+        _plot_series(ax, time_data, therms, line_props)
+
         ax.set_title(f"Thermistors during fill — {date}")
         ax.set_xlabel("Time")
         ax.set_ylabel("State")
 
         ax.legend(loc="center left", bbox_to_anchor=(1, 0.5), prop={"size": 9})
 
-        if not transparent:
-            path = f"{plot_path_root}_thermistors{transparent_suffix}.pdf"
-            fig.savefig(path)
-            paths[f"thermistors{transparent_suffix}_pdf"] = pathlib.Path(path)
-
-        path = f"{plot_path_root}_thermistors{transparent_suffix}.png"
-        fig.savefig(path, dpi=300, transparent=transparent)
-        paths[f"thermistors{transparent_suffix}_png"] = pathlib.Path(path)
-
-        plt.close(fig)
-
-    return paths
+        return _save_plot(
+            ax.figure,
+            plot_path_root,
+            "thermistors",
+            transparent=transparent,
+            pdf=pdf,
+        )
 
 
 async def clear_lock(
@@ -1044,10 +1439,13 @@ async def clear_lock(
 
     lockfile_path = get_lockfile_path(lockfile_path)
 
-    if lockfile_path.exists():
-        if log:
-            log.warning("Lock file exists. Removing it.")
+    try:
         lockfile_path.unlink()
+    except FileNotFoundError:
+        pass
+    else:
+        if log:
+            log.warning("Lock file existed. Removed it.")
 
         if wait:
             if log:
@@ -10,6 +10,8 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import functools
+import hmac
 import logging
 import os
 from contextlib import asynccontextmanager
@@ -29,8 +31,26 @@ from lvmcryo.tools import lockfile_exists
 logger = logging.getLogger("uvicorn.error")
 
 
+@functools.cache
+def get_fill_password() -> str | None:
+    """Returns the decoded fill password from ``$LVMCRYO_FILL_PASSWORD``.
+
+    The result is cached so the password is decoded only once.
+
+    """
+
+    password_b64 = os.environ.get("LVMCRYO_FILL_PASSWORD", None)
+    if password_b64 is None:
+        return None
+
+    return base64.b64decode(password_b64.encode("utf-8")).decode("utf-8")
+
+
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Decode the fill password on startup.
+    get_fill_password()
+
     yield
 
 
@@ -83,15 +103,16 @@ async def manual_fill(
     require_password = config["server.require_password"]
 
     if require_password is True or require_password is None:
-        password_b64 = os.environ.get("LVMCRYO_FILL_PASSWORD", None)
+        password_pt = get_fill_password()
 
-        if password_b64 is None:
+        if password_pt is None:
             return {"result": False, "error": "Fill password not available."}
 
-        password_bytes = password_b64.encode("utf-8")
-        password_pt = base64.b64decode(password_bytes).decode("utf-8")
-
-        if password != password_pt:
+        # Use a constant-time comparison.
+        if not hmac.compare_digest(
+            (password or "").encode("utf-8"),
+            password_pt.encode("utf-8"),
+        ):
             return {"result": False, "error": "Invalid password."}
 
     tasks: list[asyncio.Task] = []
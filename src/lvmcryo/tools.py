@@ -10,28 +10,29 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import copy
 import inspect
-import json
+import io
 import logging
 import os
 import pathlib
+import queue
 import subprocess
-import time
-from contextlib import suppress
-from functools import partial, wraps
+from functools import lru_cache, wraps
 from logging import FileHandler, getLogger
+from logging.handlers import QueueHandler, QueueListener
 
 from typing import TYPE_CHECKING, Any, Callable, Coroutine, Sequence
 
 import httpx
 from jinja2 import Environment, FileSystemLoader
+from pydantic_core import from_json, to_json
 from rich.console import Console
 from rich.progress import BarColumn, MofNCompleteColumn, Progress, TaskID, TextColumn
 
 from lvmopstools.clu import CluClient
 from lvmopstools.retrier import Retrier
 from sdsstools.logger import CustomJsonFormatter
-from sdsstools.utils import run_in_executor
 
 from lvmcryo.config import ParameterOrigin, get_internal_config
 
@@ -45,8 +46,14 @@ if TYPE_CHECKING:
     from lvmcryo.handlers.ln2 import LN2Handler
 
 
+@lru_cache()
 def is_container():
-    """Returns `True` if the code is running inside a container."""
+    """Returns `True` if the code is running inside a container.
+
+    The result is cached since the environment does not change during the
+    lifetime of the process.
+
+    """
 
     is_container = os.getenv("IS_CONTAINER", None)
     if not is_container or is_container in ["", "0"]:
@@ -55,11 +62,32 @@ def is_container():
     return True
 
 
+class TimerProgress(Progress):
+    """A `~rich.progress.Progress` whose tasks advance with the elapsed time.
+
+    The completed value of each task is updated from the time elapsed since the
+    task was started every time the progress bar is rendered, so no updates are
+    required from the event loop.
+
+    """
+
+    def get_renderables(self):
+        """Updates the completed time of the tasks and renders them."""
+
+        for task in self.tasks:
+            if task.total is not None and task.elapsed is not None:
+                completed = min(int(task.elapsed), int(task.total))
+                self.update(task.id, completed=completed)
+
+        yield from super().get_renderables()
+
+
 class TimerProgressBar:
     """A progress bar with a timer."""
 
     def __init__(self, console: Console | None = None):
-        self.progress = Progress(
+        # The progress bar is rendered from Rich's refresh thread.
+        self.progress = TimerProgress(
             TextColumn("[yellow]({task.fields[label]})"),
             TextColumn("[progress.description]{task.description}"),
             BarColumn(bar_width=None),
@@ -68,7 +96,7 @@ class TimerProgressBar:
             refresh_per_second=1,
             expand=True,
             transient=False,
-            auto_refresh=False,
+            auto_refresh=True,
             console=console,  # Need to use same console as logger.
         )
         self.console = self.progress.console
@@ -92,46 +120,23 @@ class TimerProgressBar:
 
         self.progress.start()
 
-        start_time = time.time()
-
         async def update_timer():
-            elapsed = 0
-            while True:
-                if elapsed > max_time:
-                    break
-
-                self.progress.update(task_id, advance=1, visible=True)
-                asyncio.create_task(run_in_executor(self.progress.refresh))
-
-                await asyncio.sleep(1)
-                elapsed += 1
-
-        done_timer_partial = partial(
-            self._done_timer,
-            start_time,
-            max_time,
-            complete_description,
-            task_id,
-        )
+            # The progress bar advances itself, we only need to wait. The timer
+            # is also completed if the task is cancelled.
+            try:
+                await asyncio.sleep(max_time)
+            finally:
+                self._done_timer(complete_description, task_id)
 
         _task = asyncio.create_task(update_timer())
-        _task.add_done_callback(done_timer_partial)
 
         self._tasks[task_id] = _task
 
         return task_id
 
-    def _done_timer(
-        self,
-        start_time: float,
-        max_time: float,
-        complete_description: str,
-        task_id: TaskID,
-        *_,
-    ):
-        completed = int(time.time() - start_time)
-        if completed > max_time:
-            completed = int(max_time)
+    def _done_timer(self, complete_description: str, task_id: TaskID):
+        # Freeze the elapsed time if the timer was stopped early.
+        self.progress.stop_task(task_id)
 
         self.progress.update(
             task_id,
@@ -153,7 +158,7 @@ class TimerProgressBar:
         if clear:
             self.progress.update(task_id, visible=False)
 
-        await asyncio.sleep(1)  # Extra time for renders.
+        self.progress.refresh()
 
     def close(self):
         """Closes the progress bar."""
@@ -168,13 +173,31 @@ async def cancel_task(task: asyncio.Future | None):
     if task is None or task.done():
         return None
 
+    # A task cannot wait for itself to finish.
+    current_task = asyncio.current_task()
+    if task is current_task:
+        return None
+
+    # Record the pending cancellation requests of the current task so that we
+    # can tell if it is cancelled while waiting (as asyncio.timeout does). A
+    # cancellation delivered before, e.g. when called from a finally block,
+    # must not prevent the rest of the clean-up from running.
+    n_cancelling = current_task.cancelling() if current_task is not None else 0
+
     task.cancel()
-    with suppress(asyncio.CancelledError):
+    try:
         await task
+    except asyncio.CancelledError:
+        if current_task is not None and current_task.cancelling() > n_cancelling:
+            raise
 
     return None
 
 
+# Directory with the templates distributed with the package.
+TEMPLATES_PATH = pathlib.Path(__file__).parent / "templates"
+
+
 def render_template(
     template: str | None = None,
     file: str | os.PathLike | None = None,
@@ -197,25 +220,37 @@ def render_template(
         raise ValueError("Only one of template or file can be defined.")
 
     if template is not None:
-        templates_path = pathlib.Path(__file__).parent / "templates"
-        loader = FileSystemLoader(templates_path)
+        templates_path = TEMPLATES_PATH
     elif file is not None:
-        dirname = pathlib.Path(file).parent
-        loader = FileSystemLoader(dirname)
-        template = dirname.name
+        templates_path = pathlib.Path(file).absolute().parent
+        template = pathlib.Path(file).name
     else:
         raise ValueError("Either template or file must be defined.")
 
-    env = Environment(
-        loader=loader,
-        lstrip_blocks=True,
-        trim_blocks=True,
-    )
+    env = _get_jinja_environment(templates_path)
     html_template = env.get_template(template)
 
     return html_template.render(**render_data)
 
 
+@lru_cache()
+def _get_jinja_environment(templates_path: pathlib.Path) -> Environment:
+    """Returns a cached Jinja2 environment for a templates directory.
+
+    The environment caches the compiled templates, so reusing it avoids parsing
+    and compiling the template on each render. Templates are not checked for
+    changes on disk.
+
+    """
+
+    return Environment(
+        loader=FileSystemLoader(templates_path),
+        lstrip_blocks=True,
+        trim_blocks=True,
+        auto_reload=False,
+    )
+
+
 class LockExistsError(RuntimeError):
     """Raised when a lock file already exists."""
 
@@ -272,10 +307,18 @@ async def ensure_lock(
 
     lockfile = pathlib.Path(lockfile)
 
-    if lockfile.exists():
+    # Create the lock file atomically. This fails if the file already exists,
+    # even if another process is trying to create it at the same time. The PID
+    # is written to the file to help diagnose stale locks.
+    try:
+        fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
         raise LockExistsError(f"Lock file {lockfile} already exists.")
 
-    lockfile.touch()
+    try:
+        os.write(fd, f"{os.getpid()}\n".encode())
+    finally:
+        os.close(fd)
 
     monitor_task: asyncio.Task | None = None
 
@@ -295,21 +338,87 @@ async def ensure_lock(
         lockfile.unlink(missing_ok=True)
 
 
+def get_http_client(
+    client: httpx.AsyncClient | None = None,
+) -> contextlib.AbstractAsyncContextManager[httpx.AsyncClient]:
+    """Returns a context manager with an HTTP client.
+
+    If ``client`` is passed, it is reused and not closed on exit, which allows
+    sharing the connection pool between requests. Otherwise a new client is
+    created and closed when the context exits.
+
+    """
+
+    if client is not None:
+        return contextlib.nullcontext(client)
+
+    return httpx.AsyncClient(follow_redirects=True)
+
+
+@lru_cache()
 def get_fake_logger():
-    """Gets a logger with a disabled handler."""
+    """Gets a disabled logger that discards all the messages.
+
+    A dedicated logger is used so that the module logger is not disabled for
+    other users. The logger is created once and reused.
 
-    logger = getLogger(__name__)
+    """
+
+    logger = getLogger(f"{__name__}.fake")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
     logger.disabled = True
 
     return logger
 
 
+def share_concurrent_calls(func):
+    """A decorator that shares the result of a coroutine between concurrent calls.
+
+    If the decorated coroutine function is called while a call with the same
+    arguments is in progress, the new call waits for the ongoing one and returns
+    its result instead of starting a new request. Results are not kept once the
+    call completes, so callers never receive stale values.
+
+    """
+
+    pending: dict[tuple, asyncio.Task] = {}
+
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        key = (loop, args, tuple(sorted(kwargs.items())))
+
+        if key not in pending:
+
+            def done_callback(task: asyncio.Task):
+                pending.pop(key, None)
+
+                # Retrieve the exception so that it is not reported as never
+                # retrieved if all the callers were cancelled.
+                if not task.cancelled():
+                    task.exception()
+
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(done_callback)
+            pending[key] = task
+
+        # Shield the task so that cancelling one caller does not cancel the rest.
+        return await asyncio.shield(pending[key])
+
+    return inner
+
+
+@share_concurrent_calls
 @Retrier(max_attempts=3, delay=0.5)
-async def o2_alert(route: str = "http://lvm-hub.lco.cl:8090/api/alerts"):
+async def o2_alert(
+    route: str = "http://lvm-hub.lco.cl:8090/api/alerts",
+    client: httpx.AsyncClient | None = None,
+):
     """Is there an active O2 alert?"""
 
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        response = await client.get(route)
+    async with get_http_client(client) as http_client:
+        response = await http_client.get(route)
 
     if response.status_code != 200:
         raise RuntimeError(response.text)
@@ -322,6 +431,10 @@ async def o2_alert(route: str = "http://lvm-hub.lco.cl:8090/api/alerts"):
             return alerts["o2_alert"]
 
 
+LN2_ESTOP_LABEL = "E_STOP_LN2"
+
+
+@share_concurrent_calls
 @Retrier(max_attempts=3, delay=0.5)
 async def ln2_estops():
     """Returns :obj:`True` if any of the LN2 emergency stops are active."""
@@ -329,16 +442,127 @@ async def ln2_estops():
     async with CluClient() as client:
         try:
             status = await client.send_command("lvmecp", "status")
-            safety_labels = status.replies.get("safety_status_labels").split(",")
-            return "E_STOP_LN2" in safety_labels
+            safety_labels = status.replies.get("safety_status_labels")
+            if safety_labels is None:
+                raise ValueError("safety_status_labels not found in status.")
+
+            # Match whole comma-separated labels without splitting the string.
+            return f",{LN2_ESTOP_LABEL}," in f",{safety_labels},"
         except Exception as ee:
             raise RuntimeError(f"Error reading estops: {ee}")
 
 
-def add_json_handler(log: logging.Logger, json_path: os.PathLike | pathlib.Path):
-    """Adds a JSON handler to a logger."""
+class QueuedFileHandler(QueueHandler):
+    """A queue handler that writes records to a file from a background thread.
+
+    The records are formatted and written by a `~logging.FileHandler` owned by
+    a `~logging.handlers.QueueListener`, so logging does not block the event
+    loop on disk I/O. :obj:`.flush` waits until all the queued records have
+    been written to the file.
+
+    Parameters
+    ----------
+    path
+        The path to the file to write.
+    mode
+        The mode used to open the file.
+
+    """
+
+    def __init__(self, path: os.PathLike | str, mode: str = "a"):
+        # A Queue, unlike a SimpleQueue, can be joined until all the records
+        # have been processed by the listener.
+        super().__init__(queue.Queue())
+
+        self.file_handler = FileHandler(str(path), mode=mode)
+        self.baseFilename = self.file_handler.baseFilename
+
+        self.listener = QueueListener(
+            self.queue,
+            self.file_handler,
+            respect_handler_level=True,
+        )
+        self.listener.start()
+
+        self._closed: bool = False
+
+    def setLevel(self, level: int | str):
+        """Sets the level of the handler and the file handler."""
+
+        super().setLevel(level)
+        self.file_handler.setLevel(level)
+
+    def setFormatter(self, fmt: logging.Formatter | None):
+        """Sets the formatter of the file handler."""
+
+        self.file_handler.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord):
+        """Returns a copy of the record with the message already formatted.
+
+        The message arguments and the exception are rendered in the logging
+        thread so that the record does not reference objects that may change
+        before the listener writes it. The final formatting to JSON is done by
+        the file handler.
+
+        """
+
+        record = copy.copy(record)
+
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+
+        if record.exc_info and not record.exc_text:
+            formatter = self.file_handler.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+        record.exc_info = None
+
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        """Queues a record, unless the handler has been closed."""
+
+        if not self._closed:
+            super().enqueue(record)
+
+    def flush(self):
+        """Waits until all the queued records have been written and flushes."""
+
+        if not self._closed:
+            self.queue.join()
+
+        self.file_handler.flush()
+
+    def close(self):
+        """Writes the queued records, stops the listener, and closes the file."""
+
+        if not self._closed:
+            self._closed = True
+            self.listener.stop()
+
+        self.file_handler.close()
+        super().close()
+
+
+def add_json_handler(
+    log: logging.Logger,
+    json_path: os.PathLike | pathlib.Path | None = None,
+) -> logging.StreamHandler | QueuedFileHandler:
+    """Adds a JSON handler to a logger.
+
+    If ``json_path`` is `None`, the JSON records are kept in memory. Otherwise
+    they are written to the file from a background thread (see
+    `.QueuedFileHandler`).
+
+    """
+
+    json_handler: logging.StreamHandler | QueuedFileHandler
+    if json_path is None:
+        json_handler = logging.StreamHandler(io.StringIO())
+    else:
+        json_handler = QueuedFileHandler(json_path, mode="w")
 
-    json_handler = logging.FileHandler(str(json_path), mode="w")
     json_handler.setLevel(5)
     json_handler.setFormatter(CustomJsonFormatter())
     log.addHandler(json_handler)
@@ -366,7 +590,11 @@ class DBHandler:
     api_db_route
         The API route to write the data to the database.
     json_handler
-        The logging handler used to write JSON data.
+        The logging handler used to write JSON data. Can be a queued file handler
+        or a stream handler writing to memory.
+    client
+        An HTTP client to use for the requests. If not provided, a new client
+        is created for each update.
 
     """
 
@@ -376,7 +604,8 @@ class DBHandler:
         handler: LN2Handler,
         config: Config,
         api_route: str | None = None,
-        json_handler: FileHandler | None = None,
+        json_handler: logging.StreamHandler | QueuedFileHandler | None = None,
+        client: httpx.AsyncClient | None = None,
     ) -> None:
         self.pk: int | None = None
 
@@ -386,19 +615,58 @@ class DBHandler:
         self.api_route = api_route or config.internal_config["api_routes.register_fill"]
 
         self.json_handler = json_handler
+        self.client = client
 
         self.complete: bool = False
         self.plot_paths: dict[str, pathlib.Path] = {}
         self.error: Exception | str | None = None
 
+        self._configuration_data: dict[str, Any] | None = None
+
+    def get_configuration_data(self):
+        """Returns the configuration, including the valves, as JSON-ready data.
+
+        The configuration does not change during the fill, so the result is
+        cached after the first call.
+
+        """
+
+        if self._configuration_data is None:
+            # valve_info is excluded from the Config model dump.
+            self._configuration_data = self.config.model_dump(mode="json") | {
+                valve: valve_model.model_dump(mode="json")
+                for valve, valve_model in self.config.valve_info.items()
+            }
+
+        return self._configuration_data
+
     def get_log_data(self):
         """Returns the log data for the fill."""
 
-        if self.json_handler:
-            self.json_handler.flush()
+        if self.json_handler is None:
+            return None
+
+        self.json_handler.flush()
+
+        # Iterate over the lines without building an intermediate list and parse
+        # them with pydantic-core, which is faster than the json module.
+        if isinstance(self.json_handler, (FileHandler, QueuedFileHandler)):
             json_path = pathlib.Path(self.json_handler.baseFilename)
-            with json_path.open("r") as ff:
-                return [json.loads(line) for line in ff.readlines()]
+
+            # Do not parse and inline very large logs. The path to the JSON
+            # file is included in the record instead.
+            max_size = self.config.db_log_data_max_size
+            if self.config.write_json and max_size is not None:
+                if json_path.stat().st_size > max_size:
+                    return None
+
+            with json_path.open("rb") as ff:
+                return [from_json(line) for line in ff if line.strip()]
+
+        stream = self.json_handler.stream
+        if isinstance(stream, io.StringIO):
+            lines = stream.getvalue().splitlines()
+            return [from_json(line) for line in lines if line.strip()]
 
         return None
 
@@ -433,14 +701,9 @@ class DBHandler:
         event_times = self.handler.event_times
         log_path = self.config.log_path
 
-        json_path = self.json_handler.baseFilename if self.json_handler else None
+        json_path = getattr(self.json_handler, "baseFilename", None)
         json_file = str(json_path) if json_path and self.config.write_json else None
 
-        configuration_json = self.config.model_dump() | {
-            valve: valve_model.model_dump()
-            for valve, valve_model in self.config.valve_info.items()
-        }
-
         # Use cached values
         self.complete = complete if complete is not None else self.complete
         self.plot_paths = plot_paths if plot_paths is not None else self.plot_paths
@@ -460,28 +723,35 @@ class DBHandler:
             "abort_time": date_json(event_times.abort_time),
             "failed": self.handler.failed,
             "aborted": self.handler.aborted,
-            "plot_paths": {k: str(v) for k, v in self.plot_paths.items()},
-            "log_file": str(log_path) if log_path else None,
+            "plot_paths": self.plot_paths,
+            "log_file": log_path,
             "valve_times": self.handler.get_valve_times(as_string=True),
-            "json_file": str(json_file) if json_file else None,
+            "json_file": json_file,
             "log_data": self.get_log_data(),
-            "configuration": configuration_json,
+            "configuration": self.get_configuration_data(),
             "error": str(self.error) if self.error is not None else None,
         }
 
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.post(self.api_route, json=payload)
+        async with get_http_client(self.client) as client:
+            # pydantic-core serialises the paths natively and is faster than
+            # the standard library encoder used by httpx. Dates are serialised
+            # with isoformat() to keep the format stored in the database.
+            response = await client.post(
+                self.api_route,
+                content=to_json(payload),
+                headers={"Content-Type": "application/json"},
+            )
 
-            if response.status_code != 200:
-                if raise_on_error:
-                    raise RuntimeError(f"Error writing to the DB: {response.text}")
-                else:
-                    log.warning(f"Error writing to the DB: {response.text}")
-                    log.warning(f"DB payload: {payload}")
+        if response.status_code != 200:
+            if raise_on_error:
+                raise RuntimeError(f"Error writing to the DB: {response.text}")
+            else:
+                log.warning(f"Error writing to the DB: {response.text}")
+                log.warning(f"DB payload: {payload}")
 
-                return self.pk
+            return self.pk
 
-            self.pk = response.json()
+        self.pk = response.json()
 
         return self.pk
 
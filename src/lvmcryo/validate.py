@@ -26,6 +26,10 @@ from lvmcryo.tools import get_fake_logger
 __all__ = ["validate_fill"]
 
 
+# Expression selecting the camera LN2 temperatures in the post-fill data.
+LN2_TEMPERATURE_COLUMNS = polars.col("^temp_[rbz][1-3]_ln2$")
+
+
 def log_or_raise(
     log: logging.Logger | SDSSLogger | None,
     raise_on_error: bool,
@@ -103,7 +107,12 @@ def validate_fill(
             )
             return (False, None)
 
-        data = polars.read_parquet(data)
+        # Only read the columns we need from the file.
+        data = (
+            polars.scan_parquet(file_)
+            .select(polars.col.time, LN2_TEMPERATURE_COLUMNS)
+            .collect()
+        )
 
     event_times = ln2_handler.event_times
 
@@ -124,7 +133,21 @@ def validate_fill(
         # There was no LN2 fill.
         pass
     else:
-        ln2_temp = data.select(polars.col.time, polars.col("^temp_[rbz][1-3]_ln2$"))
+        # Only select the LN2 temperatures for the cameras that were filled.
+        ln2_columns = [
+            column
+            for camera in ln2_handler.cameras
+            if (column := f"temp_{camera}_ln2") in data.columns
+        ]
+
+        if len(ln2_columns) == 0:
+            log_p(
+                "No LN2 temperature data found for the filled cameras.",
+                level=logging.WARNING,
+            )
+            return (failed, error)
+
+        ln2_temp = data.select(polars.col.time, *ln2_columns)
         ln2_temp = ln2_temp.sort(polars.col.time)
 
         # Check that the last point was taken at least 3 minutes after the fill.
@@ -137,16 +160,17 @@ def validate_fill(
                 level=logging.WARNING,
             )
         else:
-            for column in ln2_temp.columns:
-                if column == "time":
-                    continue
+            # Get the first and last temperatures for all the cameras at once.
+            first_last = ln2_temp.select(
+                polars.col(ln2_columns).first().name.suffix("_first"),
+                polars.col(ln2_columns).last().name.suffix("_last"),
+            ).row(0, named=True)
 
+            for column in ln2_columns:
                 camera = column.split("_")[1]
-                if camera not in ln2_handler.cameras:
-                    continue
 
-                temp0 = ln2_temp[0, column]
-                temp1 = ln2_temp[-1, column]
+                temp0 = first_last[f"{column}_first"]
+                temp1 = first_last[f"{column}_last"]
 
                 # Check if the temperature increased after the fill. If the temperature
                 # increased but withing the threshold, log a warning. Otherwise, fail
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# @Author: José Sánchez-Gallego (gallegoj@uw.edu)
+# @Date: 2026-10-16
+# @Filename: test_runner.py
+# @License: BSD 3-clause (http://www.opensource.org/licenses/BSD-3-Clause)
+
+from __future__ import annotations
+
+import numpy
+import pytest
+
+from lvmcryo.runner import _downsample
+
+
+@pytest.mark.parametrize("n_points", [2999, 3999, 10001])
+def test_downsample_keeps_extrema(n_points: int):
+    """Tests that downsampling keeps the extrema and the last point."""
+
+    times = numpy.arange(n_points, dtype=float)
+    values = numpy.sin(times / 100.0)
+
+    # Add spikes in the part of the series that is not a full bucket.
+    values[n_points - 2] = 10.0
+    values[n_points - 3] = -10.0
+
+    times_ds, values_ds = _downsample(times, values, max_points=2000)
+
+    assert len(values_ds) <= 2004
+    assert values_ds.max() == values.max()
+    assert values_ds.min() == values.min()
+    assert times_ds[0] == times[0]
+    assert times_ds[-1] == times[-1]
+    assert numpy.all(numpy.diff(times_ds) > 0)
+
+
+def test_downsample_short_series():
+    """Tests that short series are not downsampled."""
+
+    times = numpy.arange(100, dtype=float)
+    values = numpy.arange(100, dtype=float)
+
+    times_ds, values_ds = _downsample(times, values, max_points=2000)
+
+    assert numpy.array_equal(times_ds, times)
+    assert numpy.array_equal(values_ds, values)
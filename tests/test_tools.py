@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# @Author: José Sánchez-Gallego (gallegoj@uw.edu)
+# @Date: 2026-10-16
+# @Filename: test_tools.py
+# @License: BSD 3-clause (http://www.opensource.org/licenses/BSD-3-Clause)
+
+from __future__ import annotations
+
+import asyncio
+import gc
+import logging
+import pathlib
+
+import pytest
+
+from lvmcryo.tools import QueuedFileHandler, cancel_task, share_concurrent_calls
+
+
+async def test_cancel_task():
+    """Tests cancelling a task."""
+
+    task = asyncio.create_task(asyncio.sleep(10))
+    await asyncio.sleep(0)
+
+    await cancel_task(task)
+    assert task.cancelled()
+
+
+async def test_cancel_task_current_task():
+    """Tests that cancel_task does not wait for the current task."""
+
+    async def cancel_self():
+        await cancel_task(asyncio.current_task())
+        return True
+
+    assert await asyncio.create_task(cancel_self())
+
+
+async def test_cancel_task_propagates_outer_cancellation():
+    """Tests that cancelling the caller while it waits is not swallowed."""
+
+    async def slow_to_cancel():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            await asyncio.sleep(0.1)
+
+    reached_end: bool = False
+
+    async def outer():
+        nonlocal reached_end
+
+        inner = asyncio.create_task(slow_to_cancel())
+        await asyncio.sleep(0)
+
+        await cancel_task(inner)
+        reached_end = True
+
+    outer_task = asyncio.create_task(outer())
+    await asyncio.sleep(0.05)
+    outer_task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await outer_task
+
+    assert not reached_end
+
+
+async def test_cancel_task_in_finally_after_cancellation():
+    """Tests that clean-up after cancel_task runs in a cancelled task."""
+
+    cleaned_up: bool = False
+
+    async def run():
+        nonlocal cleaned_up
+
+        monitor = asyncio.create_task(asyncio.sleep(10))
+
+        try:
+            await asyncio.sleep(10)
+        finally:
+            await cancel_task(monitor)
+            cleaned_up = True
+
+    task = asyncio.create_task(run())
+    await asyncio.sleep(0.01)
+    task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert cleaned_up
+
+
+@pytest.fixture()
+def queued_logger(tmp_path: pathlib.Path):
+    """Yields a logger with a queued file handler and the path to the file."""
+
+    path = tmp_path / "test.log"
+
+    handler = QueuedFileHandler(path, mode="w")
+    handler.setLevel(logging.DEBUG)
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+
+    log = logging.getLogger(f"lvmcryo.test.{tmp_path.name}")
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+    log.addHandler(handler)
+
+    yield log, handler, path
+
+    log.removeHandler(handler)
+    handler.close()
+
+
+def test_queued_file_handler_order(queued_logger):
+    """Tests that the records are written in order after a flush."""
+
+    log, handler, path = queued_logger
+
+    for ii in range(1000):
+        log.debug("record %d", ii)
+
+    handler.flush()
+
+    lines = path.read_text().splitlines()
+    assert lines == [f"DEBUG record {ii}" for ii in range(1000)]
+
+
+def test_queued_file_handler_close(queued_logger):
+    """Tests that closing the handler writes the pending records."""
+
+    log, handler, path = queued_logger
+
+    for ii in range(100):
+        log.info("record %d", ii)
+
+    log.removeHandler(handler)
+    handler.close()
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 100
+    assert lines[-1] == "INFO record 99"
+
+    # Flushing or logging after closing does not block or fail.
+    handler.handle(logging.makeLogRecord({"msg": "after close"}))
+    handler.flush()
+
+
+def test_queued_file_handler_formats_eagerly(queued_logger):
+    """Tests that the message is formatted when the record is logged."""
+
+    log, handler, path = queued_logger
+
+    class Value:
+        def __init__(self, value: str):
+            self.value = value
+
+        def __str__(self):
+            return self.value
+
+    value = Value("original")
+    log.info("value %s", value)
+    value.value = "mutated"
+
+    try:
+        raise ValueError("test error")
+    except ValueError:
+        log.exception("failed")
+
+    handler.flush()
+
+    text = path.read_text()
+    assert "INFO value original" in text
+    assert "mutated" not in text
+    assert "ValueError: test error" in text
+
+
+async def test_share_concurrent_calls():
+    """Tests that concurrent calls with the same arguments share a call."""
+
+    n_calls: int = 0
+
+    @share_concurrent_calls
+    async def query(value: int = 1):
+        nonlocal n_calls
+        n_calls += 1
+
+        await asyncio.sleep(0.05)
+        return value * 2
+
+    results = await asyncio.gather(query(), query(), query(value=2))
+    assert results == [2, 2, 4]
+    assert n_calls == 2
+
+    # Results are not kept after the call completes.
+    assert await query() == 2
+    assert n_calls == 3
+
+
+async def test_share_concurrent_calls_error():
+    """Tests that an error is raised to all the waiting callers."""
+
+    n_calls: int = 0
+
+    @share_concurrent_calls
+    async def query():
+        nonlocal n_calls
+        n_calls += 1
+
+        await asyncio.sleep(0.05)
+        raise ValueError("query failed")
+
+    results = await asyncio.gather(query(), query(), return_exceptions=True)
+
+    assert n_calls == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+async def test_share_concurrent_calls_all_cancelled():
+    """Tests that an error is retrieved if all the callers are cancelled."""
+
+    loop = asyncio.get_running_loop()
+
+    errors: list[dict] = []
+    loop.set_exception_handler(lambda _, context: errors.append(context))
+
+    @share_concurrent_calls
+    async def query():
+        await asyncio.sleep(0.05)
+        raise ValueError("query failed")
+
+    callers = [asyncio.create_task(query()) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    for caller in callers:
+        caller.cancel()
+
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0.1)
+
+    # Make sure the shared task has been garbage collected.
+    gc.collect()
+
+    assert errors == []
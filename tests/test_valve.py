@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# @Author: José Sánchez-Gallego (gallegoj@uw.edu)
+# @Date: 2026-10-16
+# @Filename: test_valve.py
+# @License: BSD 3-clause (http://www.opensource.org/licenses/BSD-3-Clause)
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from lvmcryo.handlers.valve import close_all_valves
+
+
+VALVE_INFO = {
+    "r1": {"actor": "lvmnps.sp1", "outlet": "r1"},
+    "b1": {"actor": "lvmnps.sp1", "outlet": "b1"},
+    "z1": {"actor": "lvmnps.sp1", "outlet": "z1"},
+}
+
+
+async def test_close_all_valves_one_fails(mocker):
+    """Tests that all valves are closed even if one of them fails."""
+
+    ln2_estops = mocker.patch(
+        "lvmcryo.handlers.valve.ln2_estops",
+        new_callable=mocker.AsyncMock,
+        return_value=False,
+    )
+
+    closed: list[str] = []
+    error = RuntimeError("Command 'lvmnps.sp1 off b1' failed")
+
+    async def valve_on_off(actor: str, outlet: str, on: bool, **kwargs):
+        assert on is False
+        assert kwargs["check_estops"] is False
+
+        if outlet == "b1":
+            raise error
+
+        # Make the other valves finish after the failure.
+        await asyncio.sleep(0.05)
+        closed.append(outlet)
+
+    mocker.patch("lvmcryo.handlers.valve.valve_on_off", side_effect=valve_on_off)
+
+    with pytest.raises(RuntimeError, match="Failed closing valves: b1") as exc_info:
+        await close_all_valves({"valve_info": VALVE_INFO})
+
+    assert sorted(closed) == ["r1", "z1"]
+    assert exc_info.value.__cause__ is error
+
+    ln2_estops.assert_awaited_once()
+
+
+async def test_close_all_valves_estops(mocker):
+    """Tests that the valves are not commanded if the e-stops are active."""
+
+    mocker.patch(
+        "lvmcryo.handlers.valve.ln2_estops",
+        new_callable=mocker.AsyncMock,
+        return_value=True,
+    )
+    valve_on_off = mocker.patch(
+        "lvmcryo.handlers.valve.valve_on_off",
+        new_callable=mocker.AsyncMock,
+    )
+
+    with pytest.raises(RuntimeError, match="e-stops are active"):
+        await close_all_valves({"valve_info": VALVE_INFO})
+
+    valve_on_off.assert_not_called()